@@ -1,15 +1,119 @@
 from dotenv import load_dotenv
 import asyncio
+import hashlib
 import os
 import re
 from urllib.parse import urljoin, urlparse
 from pathlib import Path
 import aiohttp
+import aiofiles
 import json
 from playwright.async_api import async_playwright
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 load_dotenv() 
 
+# category -> (log label, filename prefix, default extension, keep URL extension)
+ASSET_FILENAMES = {
+    'css': ('CSS', 'style', '.css', False),
+    'js': ('JS', 'script', '.js', False),
+    'images': ('Image', 'image', '.jpg', True),
+    'svgs': ('SVG', 'svg', '.svg', False),
+    'fonts': ('Font', 'font', '.woff2', True)
+}
+
+# Public CDNs whose absolute URLs keep working from a local copy, so their
+# assets are left referenced remotely instead of being saved
+_CDN_HOSTS = frozenset({
+    'fonts.googleapis.com',
+    'fonts.gstatic.com',
+    'cdnjs.cloudflare.com',
+    'cdn.jsdelivr.net',
+    'unpkg.com',
+    'ajax.googleapis.com'
+})
+
+# Matches url(...) references in CSS, with or without quotes or inner
+# whitespace. Works on bytes so rewriting a stylesheet never has to guess
+# (and re-encode) its charset
+_CSS_URL_RE = re.compile(rb"url\(\s*['\"]?([^'\")]+?)['\"]?\s*\)")
+
+# Responses up to this size are read whole and handed to the writer queue;
+# larger ones are streamed straight to disk
+SMALL_FILE_BYTES = 256 * 1024
+
+# Read/write size for streamed downloads. 64 KiB keeps the number of read()
+# and write() syscalls low on multi-MiB assets (8 KiB chunks
+# would need 8x as many) while bounding memory per concurrent download
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def file_digest(path):
+    """Return (size, sha256 hex) of a file on disk, or None if it's missing"""
+    try:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_BYTES), b''):
+                digest.update(chunk)
+        return os.path.getsize(path), digest.hexdigest()
+    except OSError:
+        return None
+
+def write_json(path, data):
+    """Write data as indented JSON, using orjson when it's installed"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+class AsyncArtifactWriter:
+    """Background task that writes queued (filepath, bytes) pairs to disk"""
+
+    def __init__(self, maxsize=64):
+        # Bounded so producers get backpressure if the disk falls behind
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.task = None
+
+    async def put(self, filepath, content):
+        """Queue a file for writing, starting the consumer on first use"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        await self.queue.put((filepath, content))
+
+    @staticmethod
+    def write_batch(batch):
+        """Write a batch of files with plain blocking I/O (runs in a worker thread)"""
+        for filepath, content in batch:
+            try:
+                with open(filepath, 'wb') as f:
+                    f.write(content)
+            except OSError as e:
+                print(f"⚠️  Error writing {filepath}: {str(e)}")
+
+    async def run(self):
+        """Write queued files, draining everything pending into one thread hop"""
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await asyncio.to_thread(self.write_batch, batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def close(self):
+        """Wait for all queued writes to finish, then stop the consumer"""
+        await self.queue.join()
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
 class WebCloner:
     def __init__(self, url, output_dir="cloned_site"):
         self.url = url
@@ -22,100 +126,181 @@ class WebCloner:
             'fonts': [],
             'svgs': []
         }
+        # Output folders, built once and reused for every file path
+        root = Path(output_dir)
+        self.dirs = {name: root / name for name in (*self.assets, 'screenshots')}
+        # url -> {'etag', 'last_modified', 'filepath', 'size', 'sha256'} from
+        # previous runs; size/sha256 describe the raw body the server sent.
+        # None until load_cache() runs
+        self.cache = None
+        # Paths written from browser responses this run, which have no cache entry
+        self.captured_paths = set()
+        # Next file index per category, shared by captured and downloaded assets
+        self.counters = {key: 0 for key in self.assets}
+        # url -> filepath for every asset saved or being saved, whether it was
+        # captured from a browser response or fetched by download_assets
+        self.saved = {}
+        # url -> category for every URL in self.assets
+        self.categories = {}
+        # CDN-hosted asset URLs left as remote references
+        # (a dict used as an ordered set, since extraction and captures both add)
+        self.skipped_cdn = {}
+        self.capture_tasks = set()
+        self.writer = AsyncArtifactWriter()
 
     async def setup_directories(self):
         """Create directory structure for cloned site"""
-        directories = [
-            self.output_dir,
-            f"{self.output_dir}/css",
-            f"{self.output_dir}/js",
-            f"{self.output_dir}/images",
-            f"{self.output_dir}/fonts",
-            f"{self.output_dir}/svgs",
-            f"{self.output_dir}/screenshots"
-        ]
-        for directory in directories:
-            Path(directory).mkdir(parents=True, exist_ok=True)
+        for directory in self.dirs.values():
+            directory.mkdir(parents=True, exist_ok=True)
         print(f"✅ Created directory structure in {self.output_dir}/")
 
-    async def download_file(self, url, filepath):
-        """Download a file from URL and save it"""
+    async def download_file(self, session, url, filepath, conditional=True):
+        """Download a file from URL and save it using the shared session"""
+        # Send validators from the last run so unchanged assets come back as 304
+        headers = {}
+        entry = self.cache.get(url) if conditional else None
+        if entry and entry.get('filepath') == filepath and os.path.exists(filepath):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        stale = False
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                    if response.status == 200:
-                        content = await response.read()
-                        with open(filepath, 'wb') as f:
-                            f.write(content)
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    # File numbers aren't stable between runs and saved CSS gets
+                    # rewritten, so only keep the file if it's still the cached body
+                    on_disk = await asyncio.to_thread(file_digest, filepath)
+                    if on_disk == (entry.get('size'), entry.get('sha256')):
                         return True
+                    stale = True
+                elif response.status == 200:
+                    digest = hashlib.sha256()
+                    size = 0
+                    if response.content_length is not None and response.content_length <= SMALL_FILE_BYTES:
+                        body = await response.read()
+                        digest.update(body)
+                        size = len(body)
+                        await self.writer.put(filepath, body)
+                    else:
+                        # Stream the body to a .part file instead of buffering it in
+                        # memory, then rename it into place so an interrupted download
+                        # never leaves a truncated asset behind
+                        part_path = f"{filepath}.part"
+                        try:
+                            async with aiofiles.open(part_path, 'wb', buffering=STREAM_CHUNK_BYTES) as f:
+                                async for chunk in response.content.iter_chunked(STREAM_CHUNK_BYTES):
+                                    digest.update(chunk)
+                                    size += len(chunk)
+                                    await f.write(chunk)
+                            os.replace(part_path, filepath)
+                        except BaseException:
+                            if os.path.exists(part_path):
+                                os.remove(part_path)
+                            raise
+                    self.cache[url] = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'filepath': filepath,
+                        'size': size,
+                        'sha256': digest.hexdigest()
+                    }
+                    return True
         except Exception as e:
             print(f"⚠️  Error downloading {url}: {str(e)}")
             return False
 
+        if stale:
+            return await self.download_file(session, url, filepath, conditional=False)
+
     async def extract_assets_from_page(self, page):
         """Extract all asset URLs from the page"""
         print("\n🔍 Extracting assets from page...")
 
-        # Get all stylesheets
-        css_links = await page.evaluate("""() => {
-            return Array.from(document.querySelectorAll('link[rel="stylesheet"]'))
-                .map(link => link.href);
-        }""")
-        self.assets['css'].extend(css_links)
+        # Collect every asset category in a single round-trip to the browser
+        data = await page.evaluate(r"""() => {
+            const urlRe = /url\(['"]?([^'"]+)['"]?\)/;
 
-        # Get all scripts
-        js_links = await page.evaluate("""() => {
-            return Array.from(document.querySelectorAll('script[src]'))
+            // Stylesheets and scripts
+            const css = Array.from(document.querySelectorAll('link[rel="stylesheet"]'))
+                .map(link => link.href);
+            const js = Array.from(document.querySelectorAll('script[src]'))
                 .map(script => script.src);
-        }""")
-        self.assets['js'].extend(js_links)
 
-        # Get all images
-        image_links = await page.evaluate(r"""() => {
+            // Images, including CSS background images
             const images = Array.from(document.querySelectorAll('img[src]'))
                 .map(img => img.src);
-            const bgImages = Array.from(document.querySelectorAll('*'))
-                .map(el => {
-                    const bg = window.getComputedStyle(el).backgroundImage;
-                    const match = bg.match(/url\(['"]?([^'"]+)['"]?\)/);
-                    return match ? match[1] : null;
-                })
-                .filter(url => url && url.startsWith('http'));
-            return [...images, ...bgImages];
-        }""")
-        self.assets['images'].extend(image_links)
+            const bgImages = new Set();
 
-        # Get all SVGs (inline and external)
-        svg_links = await page.evaluate("""() => {
+            // SVGs (img and object embeds)
             const svgImages = Array.from(document.querySelectorAll('img[src$=".svg"], img[src*=".svg?"]'))
                 .map(img => img.src);
             const svgObjects = Array.from(document.querySelectorAll('object[type="image/svg+xml"]'))
                 .map(obj => obj.data);
-            return [...svgImages, ...svgObjects];
-        }""")
-        self.assets['svgs'].extend(svg_links)
 
-        # Extract fonts from CSS
-        all_fonts = await page.evaluate(r"""() => {
+            // Walk stylesheet rules once for @font-face sources and background
+            // images, instead of calling getComputedStyle on every element.
+            // Cross-origin sheets can't be read; note them for the fallback below
             const fonts = [];
+            let unreadableSheet = false;
             for (const sheet of document.styleSheets) {
                 try {
-                    for (const rule of sheet.cssRules) {
+                    const rules = Array.from(sheet.cssRules);
+                    while (rules.length) {
+                        const rule = rules.shift();
+                        if (rule.cssRules) rules.push(...rule.cssRules);  // @media, @supports
+                        if (rule.styleSheet) {  // @import
+                            try {
+                                rules.push(...rule.styleSheet.cssRules);
+                            } catch (e) {
+                                unreadableSheet = true;
+                            }
+                        }
                         if (rule instanceof CSSFontFaceRule) {
                             const src = rule.style.getPropertyValue('src');
                             const urls = src.match(/url\(['"]?([^'"]+)['"]?\)/g);
                             if (urls) {
                                 urls.forEach(url => {
-                                    const match = url.match(/url\(['"]?([^'"]+)['"]?\)/);
+                                    const match = url.match(urlRe);
                                     if (match) fonts.push(match[1]);
                                 });
                             }
+                        } else if (rule.style && rule.style.backgroundImage) {
+                            const urls = rule.style.backgroundImage.match(/url\(['"]?([^'"]+)['"]?\)/g);
+                            if (urls) {
+                                urls.forEach(url => {
+                                    const match = url.match(urlRe);
+                                    const base = rule.parentStyleSheet.href || document.baseURI;
+                                    if (match) bgImages.add(new URL(match[1], base).href);
+                                });
+                            }
                         }
                     }
-                } catch (e) {}
+                } catch (e) {
+                    unreadableSheet = true;
+                }
             }
-            return fonts;
+
+            // Inline style attributes aren't in any stylesheet. If some sheet
+            // couldn't be read, fall back to checking every element's computed style
+            const styled = unreadableSheet ? '*' : '[style*="background"]';
+            for (const el of document.querySelectorAll(styled)) {
+                const match = window.getComputedStyle(el).backgroundImage.match(urlRe);
+                if (match) bgImages.add(match[1]);
+            }
+
+            return {
+                css,
+                js,
+                images: [...images, ...[...bgImages].filter(url => url.startsWith('http'))],
+                svgs: [...svgImages, ...svgObjects],
+                fonts
+            };
         }""")
+        all_fonts = data.pop('fonts')
+        for key, urls in data.items():
+            self.assets[key].extend(urls)
 
         # Convert relative font URLs to absolute
         for font_url in all_fonts:
@@ -124,9 +309,27 @@ class WebCloner:
             else:
                 self.assets['fonts'].append(urljoin(self.url, font_url))
 
-        # Remove duplicates
+        # Remove duplicates (order-preserving) and skip URLs already claimed by
+        # another category. SVGs go before images so a .svg matched by both
+        # selectors lands in svgs/. data: URLs can't be fetched, so drop them.
+        seen = set()
+        for key in ('css', 'js', 'svgs', 'fonts', 'images'):
+            self.assets[key] = [
+                u for u in dict.fromkeys(self.assets[key])
+                if u and not u.startswith('data:') and not (u in seen or seen.add(u))
+            ]
+
+        # Leave public CDN assets as remote references
         for key in self.assets:
-            self.assets[key] = list(set(self.assets[key]))
+            kept = []
+            for u in self.assets[key]:
+                if urlparse(u).netloc in _CDN_HOSTS:
+                    self.skipped_cdn[u] = None
+                else:
+                    kept.append(u)
+            self.assets[key] = kept
+
+        self.categories = {u: key for key, urls in self.assets.items() for u in urls}
 
         print(f"✅ Found {len(self.assets['css'])} CSS files")
         print(f"✅ Found {len(self.assets['js'])} JS files")
@@ -135,78 +338,210 @@ class WebCloner:
         print(f"✅ Found {len(self.assets['svgs'])} SVGs")
 
     async def download_assets(self):
-        """Download all extracted assets"""
-        print("\n📥 Downloading assets...")
-
-        # Download CSS
-        for i, css_url in enumerate(self.assets['css']):
-            filename = f"style_{i}.css"
-            filepath = f"{self.output_dir}/css/{filename}"
-            if await self.download_file(css_url, filepath):
-                print(f"✅ Downloaded CSS: {filename}")
-
-        # Download JS
-        for i, js_url in enumerate(self.assets['js']):
-            filename = f"script_{i}.js"
-            filepath = f"{self.output_dir}/js/{filename}"
-            if await self.download_file(js_url, filepath):
-                print(f"✅ Downloaded JS: {filename}")
-
-        # Download Images
-        for i, img_url in enumerate(self.assets['images']):
-            ext = Path(urlparse(img_url).path).suffix or '.jpg'
-            filename = f"image_{i}{ext}"
-            filepath = f"{self.output_dir}/images/{filename}"
-            if await self.download_file(img_url, filepath):
-                print(f"✅ Downloaded Image: {filename}")
-
-        # Download SVGs
-        for i, svg_url in enumerate(self.assets['svgs']):
-            filename = f"svg_{i}.svg"
-            filepath = f"{self.output_dir}/svgs/{filename}"
-            if await self.download_file(svg_url, filepath):
-                print(f"✅ Downloaded SVG: {filename}")
-
-        # Download Fonts
-        for i, font_url in enumerate(self.assets['fonts']):
-            ext = Path(urlparse(font_url).path).suffix or '.woff2'
-            filename = f"font_{i}{ext}"
-            filepath = f"{self.output_dir}/fonts/{filename}"
-            if await self.download_file(font_url, filepath):
-                print(f"✅ Downloaded Font: {filename}")
+        """Download extracted assets that weren't captured from the browser"""
+        print(f"\n📥 Downloading assets ({len(self.saved)} already captured from the browser)...")
+        if self.cache is None:
+            self.load_cache()
+
+        # One session for all downloads so keep-alive connections are reused
+        connector = aiohttp.TCPConnector(limit=64, limit_per_host=16, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as session:
+            # Build (label, filename, url, filepath) jobs for every asset the
+            # browser didn't already hand us while loading the page
+            jobs = []
+            for key in ASSET_FILENAMES:
+                for url in self.assets[key]:
+                    if url in self.saved:
+                        continue
+                    # Claim the URL now so a late browser response doesn't save it again
+                    filepath = self.asset_filepath(key, url)
+                    self.saved[url] = filepath
+                    jobs.append((ASSET_FILENAMES[key][0], Path(filepath).name, url, filepath))
+
+            # Run downloads concurrently, capped by the semaphore
+            sem = asyncio.Semaphore(16)
+            tasks = [
+                asyncio.create_task(self._bounded_download(sem, session, url, filepath))
+                for _, _, url, filepath in jobs
+            ]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        for (label, filename, url, filepath), result in zip(jobs, results):
+            if result is True:
+                print(f"✅ Downloaded {label}: {filename}")
+            else:
+                # Let the browser's copy be captured if it loads it later
+                del self.saved[url]
+
+        # Make sure every small file queued above is on disk before returning
+        await self.writer.close()
+
+        self.save_cache()
+
+    def load_cache(self):
+        """Load the conditional-request cache left by a previous run"""
+        cache_path = f"{self.output_dir}/.cache.json"
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self.cache = json.load(f)
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def save_cache(self):
+        """Persist ETag/Last-Modified validators for the next run"""
+        # Entries for paths captures overwrote this run no longer describe the file
+        self.cache = {
+            url: entry for url, entry in self.cache.items()
+            if entry.get('filepath') not in self.captured_paths
+        }
+        write_json(f"{self.output_dir}/.cache.json", self.cache)
+
+    def asset_filepath(self, category, url):
+        """Reserve the next numbered file path for an asset in its category folder"""
+        _, prefix, default_ext, keep_ext = ASSET_FILENAMES[category]
+        ext = (Path(urlparse(url).path).suffix if keep_ext else '') or default_ext
+        index = self.counters[category]
+        self.counters[category] += 1
+        return str(self.dirs[category] / f"{prefix}_{index}{ext}")
+
+    def classify_response(self, response):
+        """Map a browser response to an asset category"""
+        content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+
+        # Trust the browser's own resource type first
+        resource_type = response.request.resource_type
+        if resource_type == 'stylesheet':
+            return 'css'
+        if resource_type == 'script':
+            return 'js'
+        if resource_type == 'font':
+            return 'fonts'
+        if resource_type == 'image':
+            return 'svgs' if content_type == 'image/svg+xml' else 'images'
+
+        # Otherwise (fetch, other, ...) go by content type
+        if content_type == 'text/css':
+            return 'css'
+        if 'javascript' in content_type or content_type == 'text/ecmascript':
+            return 'js'
+        if content_type == 'image/svg+xml':
+            return 'svgs'
+        if content_type.startswith('image/'):
+            return 'images'
+        if content_type.startswith('font/') or 'font' in content_type or 'woff' in content_type:
+            return 'fonts'
+        return None
+
+    def on_response(self, response):
+        """Page response listener: schedule saving of asset bodies"""
+        task = asyncio.create_task(self.capture_response(response))
+        self.capture_tasks.add(task)
+        task.add_done_callback(self.capture_tasks.discard)
+
+    async def capture_response(self, response):
+        """Save an asset the browser already fetched so it isn't downloaded again"""
+        url = response.url
+        if response.status != 200 or url in self.saved or not url.startswith('http'):
+            return
+
+        # Keep the category extraction already gave the URL so cross-category
+        # dedup holds; only URLs seen for the first time are classified
+        category = self.categories.get(url)
+        is_new = category is None
+        if is_new:
+            category = self.classify_response(response)
+            if category is None:
+                return
+
+        # Leave public CDN assets as remote references, but record them
+        if urlparse(url).netloc in _CDN_HOSTS:
+            self.skipped_cdn[url] = None
+            return
+
+        filepath = self.asset_filepath(category, url)
+        self.saved[url] = filepath
+        self.captured_paths.add(filepath)
+        try:
+            body = await response.body()
+            await self.writer.put(filepath, body)
+            if is_new:
+                self.assets[category].append(url)
+                self.categories[url] = category
+        except Exception as e:
+            # Fall back to downloading it with aiohttp
+            del self.saved[url]
+            print(f"⚠️  Error capturing {url}: {str(e)}")
+
+    async def flush_captures(self):
+        """Wait until every scheduled response capture has been written"""
+        while self.capture_tasks:
+            await asyncio.gather(*list(self.capture_tasks), return_exceptions=True)
+
+    async def _bounded_download(self, sem, session, url, filepath):
+        """Download a file while holding a slot of the concurrency semaphore"""
+        async with sem:
+            return await self.download_file(session, url, filepath)
+
+    async def rewrite_css_urls(self):
+        """Point url(...) references in saved CSS files at the local copies"""
+        rewritten = 0
+
+        for css_url in self.assets['css']:
+            css_path = self.saved.get(css_url)
+            if not css_path or not os.path.exists(css_path):
+                continue
+            css_dir = os.path.dirname(css_path)
+
+            def replace(match):
+                ref = match.group(1).strip().decode('utf-8', 'surrogateescape')
+                if ref.startswith('data:'):
+                    return match.group(0)
+                target = self.saved.get(urljoin(css_url, ref).split('#')[0])
+                if not target:
+                    return match.group(0)
+                local_ref = Path(os.path.relpath(target, css_dir)).as_posix()
+                return f"url('{local_ref}')".encode('utf-8')
+
+            css_file = Path(css_path)
+            css_bytes = css_file.read_bytes()
+            new_bytes = _CSS_URL_RE.sub(replace, css_bytes)
+            if new_bytes != css_bytes:
+                css_file.write_bytes(new_bytes)
+                rewritten += 1
+
+        print(f"✅ Rewrote asset URLs in {rewritten} CSS files")
 
     async def save_html(self, page):
         """Save the HTML DOM"""
         print("\n📄 Saving HTML...")
         html_content = await page.content()
-        with open(f"{self.output_dir}/index.html", 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        (Path(self.output_dir) / 'index.html').write_bytes(html_content.encode('utf-8'))
         print(f"✅ Saved HTML to {self.output_dir}/index.html")
 
-    async def scroll_page_fully(self, page):
-        """Scroll through entire page to trigger lazy-loaded content"""
-        print("🔄 Scrolling through page to load lazy content...")
-
-        # Get total page height
-        total_height = await page.evaluate("document.body.scrollHeight")
-        viewport_height = await page.evaluate("window.innerHeight")
-
-        # Scroll down in steps
-        current_position = 0
-        scroll_step = viewport_height
-
-        while current_position < total_height:
-            await page.evaluate(f"window.scrollTo(0, {current_position})")
-            await asyncio.sleep(0.5)  # Wait for lazy load
-            current_position += scroll_step
-
-            # Update total height in case new content loaded
-            total_height = await page.evaluate("document.body.scrollHeight")
+    async def load_lazy_content(self, page):
+        """Force lazy-loaded images to load without scrolling through the page"""
+        print("🔄 Triggering lazy-loaded content...")
+
+        # Switch native lazy images to eager and promote data-src/data-srcset
+        # placeholders used by JS lazy loaders, so everything starts loading
+        # now instead of waiting to intersect the viewport
+        await page.evaluate("""() => {
+            document.querySelectorAll('img[loading="lazy"]').forEach(img => {
+                img.loading = 'eager';
+            });
+            document.querySelectorAll('img[data-src]').forEach(img => {
+                img.src = img.dataset.src;
+            });
+            document.querySelectorAll('img[data-srcset], source[data-srcset]').forEach(el => {
+                el.srcset = el.dataset.srcset;
+            });
+        }""")
 
-        # Scroll back to top
-        await page.evaluate("window.scrollTo(0, 0)")
-        await asyncio.sleep(1)
-        print("✅ Finished scrolling through page")
+        await page.evaluate("document.fonts.ready")
+        print("✅ Lazy content triggered")
 
     async def wait_for_images_and_fonts(self, page):
         """Wait for all images and fonts to load"""
@@ -232,6 +567,107 @@ class WebCloner:
         await asyncio.sleep(2)
         print("✅ All images and fonts loaded")
 
+    async def close_cookie_popup(self, page):
+        """Click the highest-priority visible cookie-consent button"""
+        # Common cookie button selectors, in priority order
+        cookie_selectors = [
+            'text=/accept all/i',
+            'text=/accept/i',
+            'button:has-text("Accept")',
+            'button:has-text("Accept All")',
+            '[class*="accept"]',
+            '[id*="accept"]'
+        ]
+        locators = [page.locator(selector).first for selector in cookie_selectors]
+
+        # Probe every selector concurrently, but only to detect a popup;
+        # clicking here could hit several elements at once
+        tasks = [
+            asyncio.create_task(locator.wait_for(state='visible', timeout=3000))
+            for locator in locators
+        ]
+        found = False
+        pending = set(tasks)
+        try:
+            while pending and not found:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                found = any(not t.cancelled() and t.exception() is None for t in done)
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if not found:
+            return
+
+        # Click only the highest-priority selector that is visible now
+        visible = await asyncio.gather(
+            *(locator.is_visible() for locator in locators), return_exceptions=True
+        )
+        for locator, is_visible in zip(locators, visible):
+            if is_visible is not True:
+                continue
+            try:
+                await locator.click(timeout=1000)
+                print("✅ Closed cookie popup")
+                return
+            except Exception:
+                continue
+
+    async def wait_for_network_quiet(self, page, quiet_ms=500, timeout=10000):
+        """Wait until no new resource has finished loading for quiet_ms (or timeout)"""
+        # wait_for_load_state('networkidle') resolves at once after goto already
+        # reached it, so poll the page's resource timing entries instead
+        try:
+            await page.wait_for_function(
+                """(quietMs) => {
+                    if (window.__resourceCount === undefined) {
+                        // The default buffer stops at 250 entries, which would look idle
+                        performance.setResourceTimingBufferSize(100000);
+                    }
+                    const count = performance.getEntriesByType('resource').length;
+                    const now = performance.now();
+                    if (count !== window.__resourceCount) {
+                        window.__resourceCount = count;
+                        window.__resourceChangedAt = now;
+                        return false;
+                    }
+                    return now - window.__resourceChangedAt > quietMs;
+                }""",
+                arg=quiet_ms,
+                polling=100,
+                timeout=timeout
+            )
+        except Exception:
+            # Pages that keep polling the network just carry on
+            pass
+
+    async def wait_for_dom_stable(self, page, quiet_ms=500, timeout=5000):
+        """Wait until the DOM has gone quiet_ms without mutations (or timeout)"""
+        try:
+            await page.evaluate("""() => {
+                window.__lastMutation = performance.now();
+                if (!window.__mutationObserver) {
+                    window.__mutationObserver = new MutationObserver(() => {
+                        window.__lastMutation = performance.now();
+                    });
+                    window.__mutationObserver.observe(document, {
+                        childList: true, subtree: true, attributes: true, characterData: true
+                    });
+                }
+            }""")
+            await page.wait_for_function(
+                f"performance.now() - window.__lastMutation > {quiet_ms}",
+                polling=100,
+                timeout=timeout
+            )
+        except Exception:
+            # Pages that never settle (carousels, tickers) or that navigate
+            # away mid-wait (consent redirects, SPA routing) just carry on
+            pass
+
     async def take_segmented_screenshots(self, page):
         """Take multiple viewport-sized screenshots by scrolling through the page"""
         print("📸 Taking segmented viewport screenshots...")
@@ -253,7 +689,7 @@ class WebCloner:
         while current_scroll < total_height:
             # Take screenshot at current position
             await page.screenshot(
-                path=f"{self.output_dir}/screenshots/segment_{segment_num}.png"
+                path=self.dirs['screenshots'] / f"segment_{segment_num}.png"
             )
             print(f"   ✅ Saved segment {segment_num} (scroll position: {current_scroll}px)")
 
@@ -273,7 +709,7 @@ class WebCloner:
                     await asyncio.sleep(0.3)
                     segment_num += 1
                     await page.screenshot(
-                        path=f"{self.output_dir}/screenshots/segment_{segment_num}.png"
+                        path=self.dirs['screenshots'] / f"segment_{segment_num}.png"
                     )
                     print(f"   ✅ Saved segment {segment_num} (final segment)")
                 break
@@ -298,21 +734,26 @@ class WebCloner:
         """Take screenshots of the page"""
         print("\n📸 Taking screenshots...")
 
-        # Scroll through page to load lazy content
-        await self.scroll_page_fully(page)
+        # Viewport screenshot of the current state (the page is at the top and
+        # past network idle), before lazy content shifts the layout
+        await page.screenshot(path=self.dirs['screenshots'] / "viewport.png")
+        print(f"✅ Saved viewport screenshot")
+
+        # Load lazy content
+        await self.load_lazy_content(page)
 
         # Wait for all content to load
         await self.wait_for_images_and_fonts(page)
 
         # Full page screenshot
         await page.screenshot(
-            path=f"{self.output_dir}/screenshots/fullpage.png",
+            path=self.dirs['screenshots'] / "fullpage.png",
             full_page=True
         )
         print(f"✅ Saved full page screenshot")
 
         # Segmented screenshots (viewport-sized sections, no overlap)
-        # Note: segment_1.png will be the viewport screenshot
+        # Note: segment_1.png is the top viewport with lazy content loaded
         await self.take_segmented_screenshots(page)
 
     async def save_metadata(self):
@@ -327,11 +768,11 @@ class WebCloner:
                 'fonts_count': len(self.assets['fonts']),
                 'svgs_count': len(self.assets['svgs'])
             },
-            'asset_urls': self.assets
+            'asset_urls': self.assets,
+            'skipped_cdn_urls': list(self.skipped_cdn)
         }
 
-        with open(f"{self.output_dir}/metadata.json", 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2)
+        write_json(f"{self.output_dir}/metadata.json", metadata)
         print(f"✅ Saved metadata to {self.output_dir}/metadata.json")
 
     async def clone(self):
@@ -340,17 +781,26 @@ class WebCloner:
 
         # Setup directories
         await self.setup_directories()
+        self.load_cache()
 
         async with async_playwright() as p:
             try:
                 print(f"🌐 Navigating to {self.url}...")
 
                 # Launch browser with larger viewport
-                browser = await p.chromium.launch(headless=False)
+                launch_args = ['--disable-dev-shm-usage']
+                # Only for containers running as root, where Chromium's sandbox
+                # can't start; never disable it by default for arbitrary URLs
+                if os.getenv('WEB_CLONER_NO_SANDBOX') == '1':
+                    launch_args.append('--no-sandbox')
+                browser = await p.chromium.launch(headless=True, args=launch_args)
                 context = await browser.new_context(
                     viewport={'width': 1920, 'height': 1080},
                     user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
                 )
+                # Save assets as the browser loads them instead of fetching twice
+                context.on("response", self.on_response)
+
                 page = await context.new_page()
 
                 # Navigate to URL and wait for network to be idle
@@ -362,36 +812,19 @@ class WebCloner:
                 await page.wait_for_load_state('load')
 
                 # Wait for dynamic content (React/Vue/Angular to render)
-                await asyncio.sleep(3)
+                await self.wait_for_dom_stable(page)
 
                 # Try to close cookie popups
-                try:
-                    # Common cookie button selectors
-                    cookie_selectors = [
-                        'text=/accept all/i',
-                        'text=/accept/i',
-                        'button:has-text("Accept")',
-                        'button:has-text("Accept All")',
-                        '[class*="accept"]',
-                        '[id*="accept"]'
-                    ]
-                    for selector in cookie_selectors:
-                        try:
-                            await page.click(selector, timeout=1000)
-                            await asyncio.sleep(1)
-                            print("✅ Closed cookie popup")
-                            break
-                        except:
-                            continue
-                except:
-                    pass
-
-                # Wait a bit more for any post-interaction content
-                await asyncio.sleep(2)
+                await self.close_cookie_popup(page)
+
+                # Wait for any post-interaction requests and rendering
+                await self.wait_for_network_quiet(page)
+                await self.wait_for_dom_stable(page)
 
                 print("✅ Page loaded successfully")
 
                 # Extract and download all assets
+                await self.flush_captures()
                 await self.extract_assets_from_page(page)
                 await self.download_assets()
 
@@ -402,6 +835,11 @@ class WebCloner:
                 await self.take_screenshots(page)
 
                 # Save metadata
+                context.remove_listener("response", self.on_response)
+                await self.flush_captures()
+                await self.writer.close()
+                self.save_cache()
+                await self.rewrite_css_urls()
                 await self.save_metadata()
 
                 print(f"\n✅ Web cloning completed! All files saved to: {self.output_dir}/")